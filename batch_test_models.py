@@ -9,7 +9,7 @@ import time
 import re
 import requests
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 # Try to import questionary for better UI, fall back to simple input
 try:
@@ -29,6 +29,30 @@ spec.loader.exec_module(test_module)
 # Configuration
 LM_STUDIO_BASE_URL = os.environ.get("LM_STUDIO_API_URL", "http://localhost:1234").rstrip('/v1/chat/completions').rstrip('/v1')
 MODELS_CONFIG_FILE = "models_config.json"
+# Idle time-to-live for models loaded just-in-time through the API (--load-mode jit)
+JIT_TTL_SECONDS = int(os.environ.get("LMS_JIT_TTL", "600"))
+# Resident-pool mode: estimated RAM per model = file size x this factor (KV cache, runtime buffers)
+POOL_MEMORY_OVERHEAD = 1.25
+# Self-owned llama-server backend (load-option benchmarks)
+LLAMA_SERVER_BIN = os.environ.get("LLAMA_SERVER_BIN", "llama-server")
+LLAMA_SERVER_PORT = int(os.environ.get("LLAMA_SERVER_PORT", "8089"))
+# Named field-hardware profiles enforced on the llama-server process (--device-profiles).
+# cpu_cores: CPU affinity mask size, threads: inference threads, memory_gb: memory ceiling (see device_profile_limits)
+DEVICE_PROFILES = {
+    "phone-4core-6gb": {"description": "Phone-class, 4 cores, 6 GB", "cpu_cores": 4, "threads": 4, "memory_gb": 6},
+    "laptop-4core-8gb": {"description": "4-core laptop, 8 GB", "cpu_cores": 4, "threads": 4, "memory_gb": 8},
+    "laptop-8core-16gb": {"description": "8-core laptop, 16 GB", "cpu_cores": 8, "threads": 8, "memory_gb": 16},
+}
+# Written into the batch folder when a batch run finishes; test-evaluation.py --follow
+# stops watching the folder and finishes the report once it appears
+BATCH_COMPLETE_MARKER = "batch_complete.marker"
+# Pipelined evaluation (--pipeline-eval): judge each model's answers while the next one runs
+EVALUATION_SCRIPT = "test-evaluation.py"
+PIPELINE_EVAL_LOG = "pipeline_eval.log"
+# Benchmark output lives outside test_results/ so it is never mistaken for a batch folder
+BENCHMARK_RESULTS_DIR = "benchmark_results"
+BENCHMARK_QUESTION_COUNT = 3
+BENCHMARK_MAX_TOKENS = 256
 
 # Color codes for terminal output
 class Colors:
@@ -270,18 +294,24 @@ def get_available_models() -> List[Dict[str, Any]]:
         print_error(f"Failed to fetch models: {e}")
         return []
 
-def load_model(model_path: str) -> bool:
+def load_model(model_path: str, context_length: Optional[int] = None) -> bool:
     """
     Load a model in LM Studio using CLI.
+    If context_length is given, the model is loaded with that context window
+    instead of LM Studio's default (which sizes the KV cache accordingly).
     Returns True if successful, False otherwise.
     """
     import subprocess
     try:
-        print(f"    Loading via CLI: lms load \"{model_path}\" --yes")
+        command = ["lms", "load", model_path, "--yes"]
+        if context_length:
+            command += ["--context-length", str(context_length)]
+        print(f"    Loading via CLI: lms load \"{model_path}\" --yes"
+              + (f" --context-length {context_length}" if context_length else ""))
         
         # Use PIPE with errors='ignore' to avoid Unicode decode issues
         process = subprocess.Popen(
-            ["lms", "load", model_path, "--yes"],
+            command,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
@@ -345,6 +375,54 @@ def verify_model_loaded() -> bool:
     except:
         return False
 
+def jit_load_model(model_identifier: str, ttl: int = JIT_TTL_SECONDS) -> bool:
+    """
+    Load a model just-in-time by addressing it in a completion request.
+    LM Studio loads the model on first use and evicts it after `ttl` idle seconds,
+    so no CLI subprocess or fixed post-load sleep is needed.
+    Returns True if the model answered, False otherwise (e.g. JIT loading disabled).
+    """
+    print(f"    Loading via API (JIT): model=\"{model_identifier}\" ttl={ttl}s")
+    try:
+        response = requests.post(
+            f"{LM_STUDIO_BASE_URL}/v1/chat/completions",
+            json={
+                "model": model_identifier,
+                "messages": [{"role": "user", "content": "test"}],
+                "max_tokens": 1,
+                "ttl": ttl
+            },
+            timeout=180  # Covers the load itself, same budget as the CLI path
+        )
+        if response.status_code == 200 and not response.json().get("error"):
+            return True
+        print_warning(f"JIT load failed (HTTP {response.status_code}): {response.text[:200]}")
+        return False
+    except Exception as e:
+        print_warning(f"JIT load failed: {e}")
+        return False
+
+def jit_unload_model(model_identifier: str) -> bool:
+    """
+    Unload a JIT-loaded model through LM Studio's REST API (no CLI subprocess).
+    Returns True if the server unloaded it; otherwise the model is left to
+    expire on its JIT TTL (e.g. servers without the /api/v1 endpoints).
+    """
+    try:
+        response = requests.post(
+            f"{LM_STUDIO_BASE_URL}/api/v1/models/unload",
+            json={"instance_id": model_identifier},
+            timeout=30
+        )
+        if response.status_code == 200:
+            return True
+        print_warning(f"API unload failed (HTTP {response.status_code}); "
+                      f"{model_identifier} expires after its TTL")
+        return False
+    except Exception as e:
+        print_warning(f"API unload failed ({e}); {model_identifier} expires after its TTL")
+        return False
+
 def unload_model() -> bool:
     """
     Unload all loaded models in LM Studio using CLI.
@@ -373,6 +451,26 @@ def unload_model() -> bool:
         print_warning(f"Failed to unload model (may not be critical): {e}")
         return False
 
+def unload_model_by_identifier(model_identifier: str) -> bool:
+    """
+    Unload a single model by identifier, leaving other resident models loaded.
+    Returns True if the CLI reported success, False otherwise.
+    """
+    import subprocess
+    try:
+        result = subprocess.run(
+            ["lms", "unload", model_identifier],
+            capture_output=True,
+            text=True,
+            errors='ignore',  # Ignore Unicode decode errors
+            encoding='utf-8',
+            timeout=30
+        )
+        return result.returncode == 0
+    except Exception as e:
+        print_warning(f"Failed to unload {model_identifier} (may not be critical): {e}")
+        return False
+
 def save_model_selection(models: List[Dict[str, str]]):
     """Save selected models to config file for future use"""
     config = {
@@ -469,6 +567,66 @@ def create_batch_folder() -> str:
     print_success(f"Created batch folder: {batch_folder_name}")
     return batch_folder_path
 
+def start_pipeline_eval(batch_folder: str, eval_args: Optional[List[str]] = None):
+    """
+    Start `test-evaluation.py --follow` on the batch folder in the background, so
+    each model's answers are judged as soon as its results file lands. eval_args
+    are passed on to the evaluation (e.g. ['--concurrency', '8']). Output goes
+    to pipeline_eval.log in the batch folder. Returns the process, or None.
+    """
+    import subprocess
+    log_path = os.path.join(batch_folder, PIPELINE_EVAL_LOG)
+    try:
+        log = open(log_path, 'w', encoding='utf-8')
+        process = subprocess.Popen([sys.executable, EVALUATION_SCRIPT, '--follow', '--batch-folder', batch_folder,
+                                    *(eval_args or [])],
+                                   stdout=log, stderr=subprocess.STDOUT)
+    except OSError as e:
+        print_warning(f"Could not start pipelined evaluation: {e}")
+        return None
+    print_info(f"Pipelined evaluation started (pid {process.pid}), log: {log_path}")
+    return process
+
+def check_pipeline_eval(batch_folder: str, eval_process):
+    """
+    Warn as soon as a pipelined evaluation has exited while the batch is still running.
+    Returns the process while it runs, or None once it has exited (so it is reported once).
+    """
+    if eval_process is None or eval_process.poll() is None:
+        return eval_process
+    print_warning(f"Pipelined evaluation exited early with code {eval_process.returncode}; "
+                  f"see {os.path.join(batch_folder, PIPELINE_EVAL_LOG)}. The batch continues; evaluate it "
+                  f"afterwards with: python {EVALUATION_SCRIPT} --incremental --batch-folder {batch_folder}")
+    return None
+
+def finish_batch(batch_folder: str, results_summary: List[Dict[str, Any]], eval_process=None):
+    """Write the batch completion marker, then wait for a pipelined evaluation to judge the tail."""
+    with open(os.path.join(batch_folder, BATCH_COMPLETE_MARKER), 'w', encoding='utf-8') as f:
+        json.dump({
+            "finished_at": datetime.now().isoformat(timespec='seconds'),
+            "models": [r['model'] for r in results_summary],
+            "succeeded": sum(1 for r in results_summary if r['status'] == 'SUCCESS'),
+        }, f, indent=2)
+    if eval_process is None:
+        return
+    print_info("Waiting for the pipelined evaluation to finish the remaining answers...")
+    if eval_process.wait() == 0:
+        print_success(f"Pipelined evaluation finished; see {os.path.join(batch_folder, PIPELINE_EVAL_LOG)}")
+    else:
+        print_error(f"Pipelined evaluation exited with code {eval_process.returncode}; "
+                    f"see {os.path.join(batch_folder, PIPELINE_EVAL_LOG)}")
+
+def compute_context_length() -> Optional[int]:
+    """
+    Compute the smallest context window that fits every prompt in the questions file
+    plus the generation budget (max_tokens). Returns None if no questions file is found.
+    """
+    input_file = test_module.resolve_input_file()
+    if not input_file:
+        return None
+    questions = test_module.load_questions(input_file)
+    return test_module.required_context_length(questions, test_module.MAX_TOKENS)
+
 def extract_model_name(model_id: str) -> str:
     """
     Extract a clean model name from the model ID/path.
@@ -481,23 +639,42 @@ def extract_model_name(model_id: str) -> str:
         return name
     return model_id
 
-def run_batch_tests(selected_models: List[Dict[str, str]]):
+def run_batch_tests(selected_models: List[Dict[str, str]], load_mode: str = "cli", ttl: int = JIT_TTL_SECONDS,
+                    context_length: Optional[int] = None, pipeline_eval: Optional[List[str]] = None):
     """
     Run the crisis questions test for each selected model.
+    
+    Args:
+        selected_models: Models to test, as returned by get_available_models()
+        load_mode: "cli" loads/unloads each model with `lms load`/`lms unload --all`.
+                   "jit" addresses each model by identifier in the completion request and
+                   lets LM Studio load it just-in-time and evict it after `ttl` idle seconds.
+                   Falls back to the CLI path for any model the API cannot load.
+        ttl: Idle TTL in seconds for JIT-loaded models
+        context_length: Context window for CLI loads. None keeps LM Studio's default.
+                        JIT loads always use the server's default context length.
+        pipeline_eval: Judge each model's answers in the background while the next model runs,
+                       passing these options to test-evaluation.py ([] for none). None disables it.
     """
     total_models = len(selected_models)
     overall_start = datetime.now()
     
     # Create batch folder for this run
     batch_folder = create_batch_folder()
+    eval_process = start_pipeline_eval(batch_folder, pipeline_eval) if pipeline_eval is not None else None
     
     print_header(f"🚀 Starting Batch Test Run - {total_models} model(s)")
     print(f"Started at: {overall_start.strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"Results folder: {os.path.basename(batch_folder)}\n")
+    print(f"Results folder: {os.path.basename(batch_folder)}")
+    if context_length:
+        print(f"Context length for CLI loads: {context_length} tokens")
+    print()
     
     results_summary = []
+    jit_loaded = None  # JIT model still resident from the previous iteration
     
     for idx, model in enumerate(selected_models, 1):
+        eval_process = check_pipeline_eval(batch_folder, eval_process)
         model_id = model['id']
         model_display_name = model['display_name']
         # Use display name for file output (cleaner)
@@ -506,25 +683,41 @@ def run_batch_tests(selected_models: List[Dict[str, str]]):
         print_header(f"[{idx}/{total_models}] Testing: {model_display_name}")
         print(f"Loading: {model_id}")
         
-        # Warn if this is a variant model
-        if model.get('is_variant') and model_id != model_display_name:
-            print_warning(f"Note: This is a variant model. Loading base model '{model_id}'")
-            print_warning(f"      LM Studio will load the default quantization (not necessarily {model_display_name})")
-        
-        # Unload any previously loaded model
-        print("  → Unloading previous model...")
-        unload_model()
+        # In JIT mode the API addresses the exact variant by its display name
+        api_model = None
+        if load_mode == "jit":
+            # Don't let the previous model sit on memory until its TTL expires
+            if jit_loaded:
+                print("  → Unloading previous model...")
+                jit_unload_model(jit_loaded)
+                jit_loaded = None
+            print(f"  → Loading model...")
+            if jit_load_model(model_display_name, ttl):
+                api_model = model_display_name
+                jit_loaded = model_display_name
+            else:
+                print_warning("Falling back to CLI load")
         
-        # Load the new model
-        print(f"  → Loading model...")
-        if not load_model(model_id):
-            print_error(f"Failed to load model. Skipping...")
-            results_summary.append({
-                "model": model_name,
-                "status": "FAILED_TO_LOAD",
-                "error": "Could not load model via CLI"
-            })
-            continue
+        if api_model is None:
+            # Warn if this is a variant model
+            if model.get('is_variant') and model_id != model_display_name:
+                print_warning(f"Note: This is a variant model. Loading base model '{model_id}'")
+                print_warning(f"      LM Studio will load the default quantization (not necessarily {model_display_name})")
+            
+            # Unload any previously loaded model
+            print("  → Unloading previous model...")
+            unload_model()
+            
+            # Load the new model
+            print(f"  → Loading model...")
+            if not load_model(model_id, context_length):
+                print_error(f"Failed to load model. Skipping...")
+                results_summary.append({
+                    "model": model_name,
+                    "status": "FAILED_TO_LOAD",
+                    "error": "Could not load model via CLI"
+                })
+                continue
         
         print_success(f"Model loaded: {model_display_name}")
         
@@ -538,18 +731,16 @@ def run_batch_tests(selected_models: List[Dict[str, str]]):
             # Call the main testing function - it will auto-detect the loaded model,
             # get its size from disk, and save everything to the batch folder
             # We still pass model_name as an override for the filename
-            test_module.main(model_name=model_name, results_dir=batch_folder)
+            test_module.main(model_name=model_name, results_dir=batch_folder,
+                             api_model=api_model, ttl=ttl if api_model else None,
+                             extra_runinfo={"context_length": None if api_model else context_length})
             
             # Read the accurate timing and model info from the runinfo file
             # The runinfo file now includes model_size_bytes, model_size_gb, etc.
-            import glob
-            runinfo_pattern = os.path.join(batch_folder, f"{model_name}_*_runinfo.json")
-            runinfo_files = glob.glob(runinfo_pattern)
+            runinfo_path = find_latest_runinfo(batch_folder, model_name)
             
-            if runinfo_files:
-                # Get the most recent runinfo file
-                latest_runinfo = max(runinfo_files, key=os.path.getmtime)
-                with open(latest_runinfo, 'r', encoding='utf-8') as f:
+            if runinfo_path:
+                with open(runinfo_path, 'r', encoding='utf-8') as f:
                     runinfo = json.load(f)
                     duration = runinfo.get('duration_seconds', 0)
                     duration_mmss = runinfo.get('duration_mmss', '00:00')
@@ -586,10 +777,35 @@ def run_batch_tests(selected_models: List[Dict[str, str]]):
         print()  # Blank line between models
     
     # Unload the last model
-    print("  → Cleaning up...")
-    unload_model()
+    if jit_loaded:
+        print("  → Cleaning up...")
+        jit_unload_model(jit_loaded)
+    elif load_mode == "cli":
+        print("  → Cleaning up...")
+        unload_model()
     
-    # Print summary
+    print_batch_summary(results_summary, overall_start, total_models)
+    finish_batch(batch_folder, results_summary, eval_process)
+
+def find_latest_runinfo(batch_folder: str, model_name: str) -> Optional[str]:
+    """Return the path of the most recent runinfo file for a model in a batch folder, or None."""
+    import glob
+    runinfo_files = glob.glob(os.path.join(batch_folder, f"{model_name}_*_runinfo.json"))
+    if not runinfo_files:
+        return None
+    return max(runinfo_files, key=os.path.getmtime)
+
+def update_runinfo(runinfo_path: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge fields into an existing runinfo file and return the updated runinfo."""
+    with open(runinfo_path, 'r', encoding='utf-8') as f:
+        runinfo = json.load(f)
+    runinfo.update(fields)
+    with open(runinfo_path, 'w', encoding='utf-8') as f:
+        json.dump(runinfo, f, indent=2, ensure_ascii=False)
+    return runinfo
+
+def print_batch_summary(results_summary: List[Dict[str, Any]], overall_start: datetime, total_models: int):
+    """Print the end-of-run summary table for a batch run."""
     overall_end = datetime.now()
     overall_duration = (overall_end - overall_start).total_seconds()
     
@@ -610,6 +826,9 @@ def run_batch_tests(selected_models: List[Dict[str, str]]):
             # Add model size if available
             if result.get('model_size_gb'):
                 model_info += f", {result['model_size_gb']:.2f} GB"
+            # Pool runs share the machine; show how many models ran alongside
+            if result.get('peak_concurrency', 1) > 1:
+                model_info += f", shared with up to {result['peak_concurrency'] - 1} other model(s)"
             model_info += ")"
         elif 'error' in result:
             model_info += f" - {result['error']}"
@@ -618,8 +837,649 @@ def run_batch_tests(selected_models: List[Dict[str, str]]):
     
     print(f"\n{Colors.BOLD}Success rate: {success_count}/{total_models}{Colors.ENDC}")
 
+def get_model_size_bytes(model: Dict[str, Any]) -> Optional[int]:
+    """
+    Return the on-disk GGUF size of a selected model, or None if it cannot be found.
+    Uses the resolved file path when available, otherwise searches by display name.
+    """
+    import pathlib
+    model_id = model.get('id', '')
+    if model_id.endswith('.gguf'):
+        candidate = pathlib.Path(os.path.expanduser("~/.lmstudio/models")) / model_id
+        if candidate.exists():
+            return candidate.stat().st_size
+    _, size_bytes = test_module.find_model_file_size(model['display_name'])
+    return size_bytes
+
+def run_pool_tests(selected_models: List[Dict[str, str]], memory_budget_gb: float, ttl: int = JIT_TTL_SECONDS,
+                   pipeline_eval: Optional[List[str]] = None):
+    """
+    Run the crisis questions test with several small models resident at once.
+    
+    Models are packed first-fit (largest first) into a resident set whose estimated
+    memory (file size x POOL_MEMORY_OVERHEAD) stays within memory_budget_gb. Each
+    resident model gets its own worker thread that sends its questions sequentially,
+    so its runinfo timing covers only its own requests. When a model finishes it is
+    unloaded and the next pending models that fit are admitted.
+    
+    Models run concurrently share CPU/GPU, so their durations include contention.
+    Each runinfo gets a "resident_pool" section listing the models that overlapped
+    with it and the peak number of co-resident models.
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    
+    total_models = len(selected_models)
+    overall_start = datetime.now()
+    budget_bytes = memory_budget_gb * (1024 ** 3)
+    
+    batch_folder = create_batch_folder()
+    eval_process = start_pipeline_eval(batch_folder, pipeline_eval) if pipeline_eval is not None else None
+    
+    print_header(f"🚀 Starting Resident Pool Run - {total_models} model(s), budget {memory_budget_gb:.1f} GB")
+    print(f"Started at: {overall_start.strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"Results folder: {os.path.basename(batch_folder)}\n")
+    
+    # Estimate the resident footprint of each model; unknown sizes take the whole budget
+    pending = []
+    for model in selected_models:
+        size_bytes = get_model_size_bytes(model)
+        footprint = size_bytes * POOL_MEMORY_OVERHEAD if size_bytes else budget_bytes
+        if not size_bytes:
+            print_warning(f"Size unknown for {model['display_name']}; it will run alone")
+        pending.append((footprint, model))
+    pending.sort(key=lambda item: item[0], reverse=True)
+    
+    lock = threading.Lock()
+    resident = {}   # model_name -> footprint in bytes
+    pool_info = {}  # model_name -> {"co_resident_models": [...], "peak_concurrency": n}
+    results_summary = []
+    
+    def run_member(model: Dict[str, str]) -> Dict[str, Any]:
+        model_display_name = model['display_name']
+        model_name = extract_model_name(model_display_name)
+        if not jit_load_model(model_display_name, ttl):
+            return {"model": model_name, "status": "FAILED_TO_LOAD",
+                    "error": "Could not load model via API (JIT)"}
+        print_success(f"Model resident: {model_display_name}")
+        test_module.main(model_name=model_name, results_dir=batch_folder,
+                         api_model=model_display_name, ttl=ttl)
+        
+        # Record who shared the machine with this model while it ran
+        runinfo_path = find_latest_runinfo(batch_folder, model_name)
+        runinfo = {}
+        if runinfo_path:
+            with lock:
+                runinfo = update_runinfo(runinfo_path, {"resident_pool": {
+                    "memory_budget_gb": memory_budget_gb,
+                    "co_resident_models": sorted(pool_info[model_name]["co_resident_models"]),
+                    "peak_concurrency": pool_info[model_name]["peak_concurrency"],
+                }})
+        return {
+            "model": model_name,
+            "status": "SUCCESS",
+            "duration_seconds": runinfo.get('duration_seconds', 0),
+            "model_size_gb": runinfo.get('model_size_gb'),
+            "peak_concurrency": pool_info[model_name]["peak_concurrency"],
+        }
+    
+    def admit(executor) -> Dict[Any, tuple]:
+        """Start every pending model that fits alongside the current resident set."""
+        started = {}
+        used = sum(resident.values())
+        for item in list(pending):
+            footprint, model = item
+            if resident and used + footprint > budget_bytes:
+                continue
+            pending.remove(item)
+            model_name = extract_model_name(model['display_name'])
+            with lock:
+                # Every running model now overlaps with the newcomer, and vice versa
+                for other in resident:
+                    pool_info[other]["co_resident_models"].add(model_name)
+                    pool_info[other]["peak_concurrency"] = max(pool_info[other]["peak_concurrency"], len(resident) + 1)
+                pool_info[model_name] = {"co_resident_models": set(resident), "peak_concurrency": len(resident) + 1}
+                resident[model_name] = footprint
+            used += footprint
+            print_info(f"Admitting {model['display_name']} ({footprint / (1024 ** 3):.2f} GB est.) "
+                       f"- {len(resident)} resident, {used / (1024 ** 3):.2f}/{memory_budget_gb:.1f} GB")
+            started[executor.submit(run_member, model)] = (model_name, model['display_name'])
+        return started
+    
+    with ThreadPoolExecutor(max_workers=max(1, total_models)) as executor:
+        running = admit(executor)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                model_name, display_name = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print_error(f"Error testing {model_name}: {e}")
+                    result = {"model": model_name, "status": "ERROR", "error": str(e)}
+                if result['status'] == 'SUCCESS':
+                    print_success(f"Completed {model_name} in {result['duration_seconds']:.0f} seconds")
+                results_summary.append(result)
+                eval_process = check_pipeline_eval(batch_folder, eval_process)
+                
+                # Rotate out the finished model to free its memory for the next ones
+                unload_model_by_identifier(display_name)
+                with lock:
+                    resident.pop(model_name, None)
+            running.update(admit(executor))
+    
+    print_batch_summary(results_summary, overall_start, total_models)
+    print_info("Durations in pool mode include contention from co-resident models (see runinfo 'resident_pool').")
+    finish_batch(batch_folder, results_summary, eval_process)
+
+def resolve_model_file(model_ref: str) -> Optional[str]:
+    """
+    Resolve a model reference (GGUF path, path relative to the LM Studio models
+    directory, or an `lms ls` name) to an absolute GGUF file path.
+    """
+    import pathlib
+    if model_ref.endswith('.gguf'):
+        for candidate in (pathlib.Path(model_ref),
+                          pathlib.Path(os.path.expanduser("~/.lmstudio/models")) / model_ref):
+            if candidate.exists():
+                return str(candidate.resolve())
+    resolved = resolve_model_path(model_ref, build_model_path_map())
+    if resolved.endswith('.gguf'):
+        candidate = pathlib.Path(os.path.expanduser("~/.lmstudio/models")) / resolved
+        if candidate.exists():
+            return str(candidate)
+    file_path, _ = test_module.find_model_file_size(model_ref)
+    return file_path
+
+def start_llama_server(model_file: str, options: Dict[str, Any], port: int = LLAMA_SERVER_PORT,
+                       preexec_fn=None, timeout: int = 300, command_prefix: Optional[List[str]] = None):
+    """
+    Launch a llama-server process for model_file with the given load options and wait
+    until its /health endpoint reports ready. command_prefix (e.g. a systemd-run scope)
+    is put in front of the server command.
+    
+    Options: threads, context_length, batch_size, memory ("mmap", "no-mmap" or "mlock"),
+    gpu_layers (layers offloaded to the GPU; 0 keeps inference on the CPU).
+    Returns (process, load_seconds), or (None, None) if the server did not come up.
+    """
+    import subprocess
+    command = [*(command_prefix or []), LLAMA_SERVER_BIN, "-m", model_file, "--port", str(port)]
+    if options.get("threads"):
+        command += ["--threads", str(options["threads"])]
+    if options.get("context_length"):
+        command += ["--ctx-size", str(options["context_length"])]
+    if options.get("batch_size"):
+        command += ["--batch-size", str(options["batch_size"])]
+    if options.get("memory") == "no-mmap":
+        command += ["--no-mmap"]
+    elif options.get("memory") == "mlock":
+        command += ["--mlock"]
+    if options.get("gpu_layers") is not None:
+        command += ["--n-gpu-layers", str(options["gpu_layers"])]
+    
+    load_start = time.perf_counter()
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                   preexec_fn=preexec_fn)
+    except FileNotFoundError:
+        print_error(f"'{LLAMA_SERVER_BIN}' not found. Install llama.cpp or set LLAMA_SERVER_BIN.")
+        return None, None
+    
+    health_url = f"http://127.0.0.1:{port}/health"
+    while time.perf_counter() - load_start < timeout:
+        if process.poll() is not None:
+            print_error(f"llama-server exited with code {process.returncode}")
+            return None, None
+        try:
+            if requests.get(health_url, timeout=2).status_code == 200:
+                return process, time.perf_counter() - load_start
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.5)
+    
+    print_error(f"llama-server not ready after {timeout} seconds")
+    stop_llama_server(process)
+    return None, None
+
+def stop_llama_server(process) -> None:
+    """Terminate a llama-server process started by start_llama_server()."""
+    import subprocess
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def get_peak_rss_bytes(pid: int) -> Optional[int]:
+    """
+    Peak resident set size of a running process in bytes.
+    Reads VmHWM on Linux, or psutil's peak working set on Windows if psutil is installed.
+    """
+    try:
+        with open(f"/proc/{pid}/status", 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        memory = psutil.Process(pid).memory_info()
+        return getattr(memory, 'peak_wset', None) or memory.rss
+    except Exception:
+        return None
+
+def timed_completion(api_url: str, question: str, max_tokens: int) -> Dict[str, Any]:
+    """
+    Send one streamed chat completion and measure time to first token (TTFT),
+    generated tokens and decode speed in tokens/sec.
+    """
+    payload = {
+        "messages": [
+            {"role": "system", "content": test_module.SYSTEM_PROMPT},
+            {"role": "user", "content": question}
+        ],
+        "temperature": 0.7,
+        "max_tokens": max_tokens,
+        "stream": True
+    }
+    start = time.perf_counter()
+    first_token_at = None
+    chunk_count = 0
+    reported_tokens = None
+    try:
+        with requests.post(api_url, json=payload, stream=True, timeout=600) as response:
+            response.raise_for_status()
+            # chunk_size=None yields data as it arrives, so token timestamps are not buffered
+            for raw_line in response.iter_lines(chunk_size=None):
+                if not raw_line or not raw_line.startswith(b"data: "):
+                    continue
+                data = raw_line[len(b"data: "):]
+                if data.strip() == b"[DONE]":
+                    break
+                chunk = json.loads(data)
+                choices = chunk.get("choices") or []
+                if choices and (choices[0].get("delta") or {}).get("content"):
+                    chunk_count += 1
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                # llama-server reports exact counts in the final chunk
+                timings = chunk.get("timings") or {}
+                usage = chunk.get("usage") or {}
+                reported_tokens = timings.get("predicted_n") or usage.get("completion_tokens") or reported_tokens
+    except Exception as e:
+        return {"error": str(e)}
+    
+    end = time.perf_counter()
+    tokens = reported_tokens or chunk_count
+    decode_seconds = end - first_token_at if first_token_at else None
+    return {
+        "ttft_seconds": round(first_token_at - start, 3) if first_token_at else None,
+        "total_seconds": round(end - start, 3),
+        "completion_tokens": tokens,
+        "tokens_per_second": round(tokens / decode_seconds, 2) if decode_seconds else None,
+    }
+
+def run_load_option_benchmark(model_ref: str, matrix: Dict[str, List[Any]],
+                              question_count: int = BENCHMARK_QUESTION_COUNT,
+                              max_tokens: int = BENCHMARK_MAX_TOKENS) -> Optional[str]:
+    """
+    Benchmark one model across a matrix of load options on a self-owned llama-server.
+    
+    For every combination of matrix["threads"], matrix["context_length"],
+    matrix["batch_size"] and matrix["memory"], the server is started fresh and the
+    first question_count questions are sent. Each point records load time, median
+    TTFT, mean tokens/sec and the server's peak RSS.
+    
+    Writes benchmark_results/<model>_<timestamp>_matrix.json and returns its path.
+    """
+    import itertools
+    import statistics
+    
+    model_file = resolve_model_file(model_ref)
+    if not model_file:
+        print_error(f"Could not find a GGUF file for '{model_ref}'")
+        return None
+    
+    input_file = test_module.resolve_input_file()
+    if not input_file:
+        print_error("Could not find a questions file")
+        return None
+    questions = test_module.load_questions(input_file)[:question_count]
+    api_url = f"http://127.0.0.1:{LLAMA_SERVER_PORT}/v1/chat/completions"
+    
+    keys = ["threads", "context_length", "batch_size", "memory"]
+    points = list(itertools.product(*(matrix[k] for k in keys)))
+    print_header(f"🧪 Load-option benchmark: {os.path.basename(model_file)} - {len(points)} configuration(s)")
+    
+    results = []
+    for idx, values in enumerate(points, 1):
+        options = dict(zip(keys, values))
+        label = ", ".join(f"{k}={v}" for k, v in options.items())
+        print(f"\n[{idx}/{len(points)}] {label}")
+        
+        process, load_seconds = start_llama_server(model_file, options)
+        if process is None:
+            results.append({"options": options, "status": "FAILED_TO_LOAD"})
+            continue
+        
+        try:
+            runs = [timed_completion(api_url, q, max_tokens) for q in questions]
+            peak_rss = get_peak_rss_bytes(process.pid)
+        finally:
+            stop_llama_server(process)
+        
+        ok_runs = [r for r in runs if "error" not in r]
+        ttfts = [r["ttft_seconds"] for r in ok_runs if r.get("ttft_seconds") is not None]
+        speeds = [r["tokens_per_second"] for r in ok_runs if r.get("tokens_per_second")]
+        point = {
+            "options": options,
+            "status": "SUCCESS" if ok_runs else "ERROR",
+            "load_seconds": round(load_seconds, 2),
+            "ttft_seconds_median": round(statistics.median(ttfts), 3) if ttfts else None,
+            "tokens_per_second_mean": round(statistics.mean(speeds), 2) if speeds else None,
+            "peak_rss_bytes": peak_rss,
+            "peak_rss_gb": round(peak_rss / (1024 ** 3), 2) if peak_rss else None,
+            "errors": [r["error"] for r in runs if "error" in r],
+            "runs": runs,
+        }
+        results.append(point)
+        print(f"    load {point['load_seconds']}s | TTFT {point['ttft_seconds_median']}s | "
+              f"{point['tokens_per_second_mean']} tok/s | peak RSS {point['peak_rss_gb']} GB")
+    
+    model_name = extract_model_name(model_file)
+    os.makedirs(BENCHMARK_RESULTS_DIR, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    output_path = os.path.join(BENCHMARK_RESULTS_DIR, f"{model_name}_{timestamp}_matrix.json")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "model_name": model_name,
+            "model_file_path": model_file,
+            "backend": "llama-server",
+            "questions": questions,
+            "max_tokens": max_tokens,
+            "matrix": matrix,
+            "created_at": datetime.now().isoformat(timespec='seconds'),
+            "results": results,
+        }, f, indent=2, ensure_ascii=False)
+    
+    ranked = sorted((r for r in results if r.get("tokens_per_second_mean")),
+                    key=lambda r: r["tokens_per_second_mean"], reverse=True)
+    if ranked:
+        best = ranked[0]
+        print_success(f"Fastest: {best['options']} at {best['tokens_per_second_mean']} tok/s")
+    print_success(f"Matrix saved to {output_path}")
+    return output_path
+
+def cgroup_memory_prefix(memory_bytes: int) -> Optional[List[str]]:
+    """
+    systemd-run command prefix that runs a command in a transient scope whose
+    cgroup v2 memory.max (and swap) is capped at memory_bytes, or None if this
+    machine cannot do that (no systemd-run, cgroup v1, no delegated memory controller).
+    
+    systemd-run succeeds even where MemoryMax is silently ignored, so the probe reads
+    memory.max of its own cgroup from inside the scope and checks the cap took effect.
+    """
+    import shutil
+    import subprocess
+    if not shutil.which("systemd-run") or not os.path.exists("/sys/fs/cgroup/cgroup.controllers"):
+        return None
+    prefix = ["systemd-run", "--scope", "--quiet", "--collect",
+              "-p", f"MemoryMax={memory_bytes}", "-p", "MemorySwapMax=0", "--"]
+    if os.geteuid() != 0:
+        prefix[1:1] = ["--user"]
+    read_memory_max = ("import sys; path = open('/proc/self/cgroup').read().split('0::', 1)[1].split()[0]; "
+                       "sys.stdout.write(open('/sys/fs/cgroup' + path + '/memory.max').read())")
+    try:
+        probe = subprocess.run([*prefix, sys.executable, "-c", read_memory_max],
+                               capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    applied = probe.stdout.strip()
+    # The kernel rounds memory.max down to a whole page
+    if probe.returncode != 0 or not applied.isdigit() or not 0 <= memory_bytes - int(applied) < os.sysconf("SC_PAGE_SIZE"):
+        return None
+    return prefix
+
+def device_profile_limits(profile: Dict[str, Any]):
+    """
+    Work out how to confine a llama-server to a device profile.
+    
+    - Threads: --threads, and no GPU offload (--n-gpu-layers 0), so a desktop GPU
+      does not make the profile faster than the device
+    - CPU: affinity to the first `cpu_cores` allowed CPUs (Linux)
+    - Memory: a cgroup v2 memory.max of `memory_gb` via a systemd-run scope, which
+      counts what the server really uses, unlike an address-space limit. Where that
+      is not available, the model is loaded with --no-mmap, so its weights count in
+      the resident set, and the caller checks peak RSS against `memory_gb`.
+    
+    Returns (preexec_fn, command_prefix, server_options, enforced); enforced records
+    the limits applied and the memory mechanism ("cgroup_memory_max" or "no_mmap_rss_check").
+    """
+    memory_bytes = int(profile["memory_gb"] * (1024 ** 3))
+    options = {"threads": profile["threads"], "gpu_layers": 0}
+    enforced = {"threads": profile["threads"], "gpu_layers": 0}
+    
+    preexec = None
+    if hasattr(os, "sched_setaffinity"):
+        allowed_cpus = sorted(os.sched_getaffinity(0))[:profile["cpu_cores"]]
+        enforced["cpu_affinity"] = allowed_cpus
+        
+        def preexec():
+            os.sched_setaffinity(0, allowed_cpus)
+    
+    command_prefix = cgroup_memory_prefix(memory_bytes)
+    if command_prefix:
+        enforced["memory_limit"] = {"mechanism": "cgroup_memory_max", "bytes": memory_bytes}
+    else:
+        options["memory"] = "no-mmap"
+        enforced["memory_limit"] = {"mechanism": "no_mmap_rss_check", "bytes": memory_bytes}
+    return preexec, command_prefix, options, enforced
+
+def exceeds_memory_limit(process, enforced: Dict[str, Any]) -> Optional[int]:
+    """Peak RSS in bytes if a no_mmap_rss_check run went over its memory limit, else None."""
+    limit = enforced.get("memory_limit") or {}
+    if limit.get("mechanism") != "no_mmap_rss_check":
+        return None
+    peak_rss = get_peak_rss_bytes(process.pid)
+    return peak_rss if peak_rss and peak_rss > limit["bytes"] else None
+
+def run_device_profile_tests(selected_models: List[Dict[str, str]], profile_names: List[str],
+                             pipeline_eval: Optional[List[str]] = None):
+    """
+    Run the full question set for each model under each named device profile.
+    
+    Every (model, profile) pair gets a fresh llama-server confined by
+    device_profile_limits() and loaded with the smallest sufficient context.
+    Results are saved as '<model>__<profile>_<timestamp>.json'; the runinfo gets
+    a "device_profiles" section keyed by profile name with latency, success rate
+    and the limits that were actually enforced. A model that cannot load inside
+    the memory ceiling is recorded as FAILED_TO_LOAD for that profile.
+    """
+    import statistics
+    
+    total_runs = len(selected_models) * len(profile_names)
+    overall_start = datetime.now()
+    batch_folder = create_batch_folder()
+    eval_process = start_pipeline_eval(batch_folder, pipeline_eval) if pipeline_eval is not None else None
+    context_length = compute_context_length()
+    api_url = f"http://127.0.0.1:{LLAMA_SERVER_PORT}/v1/chat/completions"
+    
+    print_header(f"📱 Starting Device Profile Run - {len(selected_models)} model(s) × {len(profile_names)} profile(s)")
+    print(f"Results folder: {os.path.basename(batch_folder)}\n")
+    
+    results_summary = []
+    for model in selected_models:
+        model_name = extract_model_name(model['display_name'])
+        model_file = resolve_model_file(model['id']) or resolve_model_file(model['display_name'])
+        
+        for profile_name in profile_names:
+            eval_process = check_pipeline_eval(batch_folder, eval_process)
+            profile = DEVICE_PROFILES[profile_name]
+            run_name = f"{model_name}__{profile_name}"
+            print_header(f"Testing: {model['display_name']} on {profile['description']}")
+            if not model_file:
+                print_error("Could not find the model's GGUF file. Skipping...")
+                results_summary.append({"model": run_name, "status": "ERROR", "error": "GGUF file not found"})
+                continue
+            
+            preexec_fn, command_prefix, options, enforced = device_profile_limits(profile)
+            print_info(f"Memory limit: {profile['memory_gb']} GB via {enforced['memory_limit']['mechanism']}")
+            process, load_seconds = start_llama_server(
+                model_file, {**options, "context_length": context_length},
+                preexec_fn=preexec_fn, command_prefix=command_prefix)
+            if process is None:
+                results_summary.append({"model": run_name, "status": "FAILED_TO_LOAD",
+                                        "error": f"Could not load within {profile['description']} limits"})
+                continue
+            loaded_rss = exceeds_memory_limit(process, enforced)
+            if loaded_rss:
+                stop_llama_server(process)
+                print_error(f"Needs {loaded_rss / (1024 ** 3):.2f} GB after loading; "
+                            f"{profile['description']} has {profile['memory_gb']} GB. Skipping...")
+                results_summary.append({"model": run_name, "status": "FAILED_TO_LOAD",
+                                        "error": f"Resident set of {loaded_rss / (1024 ** 3):.2f} GB after loading "
+                                                 f"exceeds {profile['memory_gb']} GB"})
+                continue
+            
+            try:
+                test_module.main(model_name=run_name, results_dir=batch_folder, api_url=api_url,
+                                 extra_runinfo={
+                                     "model_file_path": model_file,
+                                     "model_size_bytes": os.path.getsize(model_file),
+                                     "model_size_gb": os.path.getsize(model_file) / (1024 ** 3),
+                                     "context_length": context_length,
+                                     "backend": "llama-server",
+                                 })
+                peak_rss = get_peak_rss_bytes(process.pid)
+                over_limit = exceeds_memory_limit(process, enforced)
+            finally:
+                stop_llama_server(process)
+            if over_limit:
+                print_warning(f"Peak RSS {over_limit / (1024 ** 3):.2f} GB went over the profile's "
+                              f"{profile['memory_gb']} GB while answering; results are marked memory_exceeded")
+            
+            runinfo_path = find_latest_runinfo(batch_folder, run_name)
+            if not runinfo_path:
+                results_summary.append({"model": run_name, "status": "ERROR", "error": "No runinfo written"})
+                continue
+            with open(runinfo_path, 'r', encoding='utf-8') as f:
+                runinfo = json.load(f)
+            latencies = runinfo.get("question_latencies_seconds") or []
+            questions_count = runinfo.get("questions_count") or 0
+            success_rate = (questions_count - runinfo.get("errors_count", 0)) / questions_count if questions_count else 0.0
+            profile_stats = {
+                "description": profile["description"],
+                "enforced": enforced,
+                "load_seconds": round(load_seconds, 2),
+                "latency_mean_seconds": round(statistics.mean(latencies), 2) if latencies else None,
+                "latency_p95_seconds": round(sorted(latencies)[int(0.95 * (len(latencies) - 1))], 2) if latencies else None,
+                "success_rate": round(success_rate, 3),
+                "peak_rss_bytes": peak_rss,
+                "memory_exceeded": bool(over_limit),
+            }
+            update_runinfo(runinfo_path, {"device_profiles": {profile_name: profile_stats}})
+            print_info(f"{profile_name}: mean latency {profile_stats['latency_mean_seconds']}s, "
+                       f"success rate {success_rate:.0%}")
+            results_summary.append({
+                "model": run_name,
+                "status": "SUCCESS",
+                "duration_seconds": runinfo.get("duration_seconds", 0),
+                "model_size_gb": runinfo.get("model_size_gb"),
+            })
+    
+    print_batch_summary(results_summary, overall_start, total_runs)
+    finish_batch(batch_folder, results_summary, eval_process)
+
+def _parse_matrix_values(value: str, cast=int) -> List[Any]:
+    """Parse a comma-separated CLI list, e.g. '2,4,8'."""
+    return [cast(v.strip()) for v in value.split(',') if v.strip()]
+
+def _context_length_arg(value: str):
+    """argparse type for --context-length: 'auto', 'default' or a positive token count."""
+    import argparse
+    if value in ('auto', 'default'):
+        return value
+    try:
+        tokens = int(value)
+    except ValueError:
+        tokens = 0
+    if tokens <= 0:
+        raise argparse.ArgumentTypeError(f"expected 'auto', 'default' or a positive token count, got '{value}'")
+    return tokens
+
 def main():
     """Main entry point for the batch tester"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Interactive batch tester for LM Studio models")
+    parser.add_argument('--load-mode', choices=['cli', 'jit'], default='cli',
+                        help="How to load models: 'cli' uses lms load/unload per model (default), "
+                             "'jit' addresses each model by identifier and lets LM Studio load it on demand")
+    parser.add_argument('--ttl', type=int, default=JIT_TTL_SECONDS,
+                        help=f'Idle TTL in seconds for JIT-loaded models (default: {JIT_TTL_SECONDS})')
+    parser.add_argument('--context-length', type=_context_length_arg, default='auto',
+                        help="Context window for CLI loads: 'auto' (smallest that fits the longest prompt "
+                             "plus max_tokens, default), 'default' (LM Studio's default) or a token count")
+    parser.add_argument('--pool-budget-gb', type=float, default=None,
+                        help='Keep several models resident within this memory budget (GB) and test them '
+                             'concurrently, rotating models in as others finish. Uses JIT loading.')
+    parser.add_argument('--benchmark', metavar='MODEL', default=None,
+                        help='Benchmark load options for one model (GGUF path or lms name) on a self-owned '
+                             'llama-server instead of running a batch')
+    parser.add_argument('--bench-threads', default=f"2,4,{os.cpu_count() or 4}",
+                        help='CPU thread counts to benchmark (comma-separated)')
+    parser.add_argument('--bench-context', default='auto,8192',
+                        help="Context lengths to benchmark; 'auto' is the smallest that fits the prompts")
+    parser.add_argument('--bench-batch', default='128,512',
+                        help='Evaluation batch sizes to benchmark (comma-separated)')
+    parser.add_argument('--bench-memory', default='mmap,no-mmap,mlock',
+                        help='Memory modes to benchmark: mmap, no-mmap, mlock (comma-separated)')
+    parser.add_argument('--bench-questions', type=int, default=BENCHMARK_QUESTION_COUNT,
+                        help=f'Number of questions per configuration (default: {BENCHMARK_QUESTION_COUNT})')
+    parser.add_argument('--device-profiles', default=None,
+                        help='Run selected models on a self-owned llama-server confined to these device '
+                             f"profiles (comma-separated): {', '.join(DEVICE_PROFILES)}")
+    parser.add_argument('--pipeline-eval', action='store_true',
+                        help=f'Run {EVALUATION_SCRIPT} --follow in the background so answers are judged while '
+                             'later models generate; the report is finished right after the last model')
+    parser.add_argument('--eval-concurrency', type=int, default=None,
+                        help='--concurrency for the pipelined evaluation (default: its EVAL_CONCURRENCY env var)')
+    parser.add_argument('--eval-pack-tokens', type=int, default=None,
+                        help='--pack-tokens for the pipelined evaluation (default: its PACK_TOKENS env var)')
+    parser.add_argument('--judge-backend', choices=['gemini', 'local'], default=None,
+                        help='--judge-backend for the pipelined evaluation (default: its JUDGE_BACKEND env var)')
+    args = parser.parse_args()
+    
+    eval_args = None
+    if args.pipeline_eval:
+        eval_args = []
+        if args.eval_concurrency is not None:
+            eval_args += ['--concurrency', str(args.eval_concurrency)]
+        if args.eval_pack_tokens is not None:
+            eval_args += ['--pack-tokens', str(args.eval_pack_tokens)]
+        if args.judge_backend:
+            eval_args += ['--judge-backend', args.judge_backend]
+    
+    if args.device_profiles:
+        profile_names = _parse_matrix_values(args.device_profiles, str)
+        unknown = [p for p in profile_names if p not in DEVICE_PROFILES]
+        if unknown:
+            parser.error(f"Unknown device profile(s): {', '.join(unknown)}")
+    
+    if args.benchmark:
+        auto_context = compute_context_length()
+        matrix = {
+            "threads": sorted(set(_parse_matrix_values(args.bench_threads))),
+            "context_length": [auto_context if v == 'auto' else int(v)
+                               for v in _parse_matrix_values(args.bench_context, str)],
+            "batch_size": _parse_matrix_values(args.bench_batch),
+            "memory": _parse_matrix_values(args.bench_memory, str),
+        }
+        output_path = run_load_option_benchmark(args.benchmark, matrix, args.bench_questions)
+        sys.exit(0 if output_path else 1)
+    
     print_header("🤖 Crisis-AI Batch Model Tester")
     
     # Check if we can connect to LM Studio
@@ -695,7 +1555,20 @@ def main():
         input("Press Enter to start batch testing (Ctrl+C to cancel)...")
     
     # Run the tests
-    run_batch_tests(selected_models)
+    if args.context_length == 'auto':
+        context_length = compute_context_length()
+    elif args.context_length == 'default':
+        context_length = None
+    else:
+        context_length = args.context_length
+    
+    if args.device_profiles:
+        run_device_profile_tests(selected_models, profile_names, pipeline_eval=eval_args)
+    elif args.pool_budget_gb:
+        run_pool_tests(selected_models, args.pool_budget_gb, ttl=args.ttl, pipeline_eval=eval_args)
+    else:
+        run_batch_tests(selected_models, load_mode=args.load_mode, ttl=args.ttl,
+                        context_length=context_length, pipeline_eval=eval_args)
     
     print_header("✨ All done!")
 
@@ -4,6 +4,7 @@ import os
 import argparse
 import sys
 import re
+import time
 from datetime import datetime
 from pathlib import Path
 
@@ -18,6 +19,9 @@ RESULTS_DIR = 'test_results'
 # The API endpoint for your LM Studio server. You can override with env var LM_STUDIO_API_URL.
 LM_STUDIO_API_URL = os.environ.get("LM_STUDIO_API_URL", "http://localhost:1234/v1/chat/completions")
 
+# Generation budget per answer. Also used to size the context window at load time.
+MAX_TOKENS = 2048
+
 # The system prompt that guides the AI's persona and response style.
 SYSTEM_PROMPT = """You are CrisisAI, an AI assistant designed to provide clear, simple, and safe advice for people in emergency situations without access to experts.
 Assume the user is under stress, has no special training, and needs practical, step-by-step instructions.
@@ -25,12 +29,16 @@ Prioritize safety above all else. Do not give medical advice that should come fr
 If a common 'myth' or dangerous misconception is part of the user's question, directly and gently correct it with the safe alternative."""
 
 # --- Helper Function to Get Loaded Model Info ---
-def get_loaded_model_info():
+def get_loaded_model_info(model_id=None, api_url=None):
     """
     Queries LM Studio API to get information about the currently loaded model.
+    If model_id is given (JIT mode, where several models may be resident),
+    returns the entry whose id is exactly that identifier, or None if there is
+    none, so another quantization or resident model is never reported instead.
+    Without model_id, returns the first loaded model.
     Returns dict with model metadata or None if failed.
     """
-    api_base = LM_STUDIO_API_URL.rsplit('/v1/', 1)[0]
+    api_base = (api_url or LM_STUDIO_API_URL).rsplit('/v1/', 1)[0]
     models_url = f"{api_base}/api/v0/models"
     
     try:
@@ -38,6 +46,12 @@ def get_loaded_model_info():
         response.raise_for_status()
         data = response.json()
         
+        if model_id:
+            for model in data.get("data", []):
+                if model.get("id") == model_id:
+                    return model
+            return None
+        
         # Find the loaded model (state == "loaded")
         for model in data.get("data", []):
             if model.get("state") == "loaded":
@@ -116,24 +130,34 @@ def find_model_file_size(model_id, publisher=None):
     return None, None
 
 # --- Helper Function to Get Model Response ---
-def get_llm_response(question):
+def get_llm_response(question, model=None, ttl=None, api_url=None):
     """
     Sends a question to the LM Studio API and returns the model's response.
+    
+    Args:
+        question: The user question to send
+        model: Model identifier to address. LM Studio loads it just-in-time if it
+               is not resident yet. Defaults to the model loaded in the UI.
+        ttl: Idle time-to-live in seconds for a JIT-loaded model
+        api_url: Chat completions endpoint to use instead of LM_STUDIO_API_URL
     """
+    api_url = api_url or LM_STUDIO_API_URL
     headers = {"Content-Type": "application/json"}
     payload = {
-        "model": "local-model",  # This is a placeholder, LM Studio uses the model loaded in the UI
+        "model": model or "local-model",  # "local-model" is a placeholder, LM Studio uses the model loaded in the UI
         "messages": [
             {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": question}
         ],
         "temperature": 0.7, # A balanced value for creativity vs. determinism.
-        "max_tokens": 2048,  # Reduced from 4096 to prevent overly long reasoning chains
+        "max_tokens": MAX_TOKENS,  # Reduced from 4096 to prevent overly long reasoning chains
         "stream": False
     }
+    if ttl:
+        payload["ttl"] = ttl
 
     try:
-        response = requests.post(LM_STUDIO_API_URL, headers=headers, json=payload, timeout=600) # 10-minute timeout for reasoning models
+        response = requests.post(api_url, headers=headers, json=payload, timeout=600) # 10-minute timeout for reasoning models
         response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
         
         response_json = response.json()
@@ -153,7 +177,7 @@ def get_llm_response(question):
 
     except requests.exceptions.RequestException as e:
         print(f"\nAPI Call Error: {e}")
-        return f"ERROR: Could not connect to the LM Studio API at {LM_STUDIO_API_URL}. Please ensure LM Studio is running and the server is started.", None
+        return f"ERROR: Could not connect to the LM Studio API at {api_url}. Please ensure LM Studio is running and the server is started.", None
     except Exception as e:
         print(f"\nAn unexpected error occurred: {e}")
         return "ERROR: An unexpected error occurred while processing the request.", None
@@ -203,6 +227,33 @@ def resolve_input_file():
     return None
 
 
+def estimate_tokens(text: str) -> int:
+    """
+    Conservative token estimate without a tokenizer: one token per 3 UTF-8 bytes.
+    English text averages closer to 4 bytes per token, so this overestimates.
+    """
+    return -(-len(text.encode('utf-8')) // 3)
+
+
+def required_context_length(questions, max_tokens: int = MAX_TOKENS, round_to: int = 256) -> int:
+    """
+    Smallest context window that fits the longest prompt plus the generation budget.
+    The prompt is the system prompt plus one question, with a per-message allowance
+    for chat template tokens. The result is rounded up to a multiple of round_to.
+    """
+    template_overhead = 32  # Role markers and special tokens for two messages plus the reply header
+    longest_prompt = max((estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(q) for q in questions), default=0)
+    needed = longest_prompt + template_overhead + max_tokens
+    return -(-needed // round_to) * round_to
+
+
+def load_questions(input_file: str) -> list:
+    """Return a flat list of all questions in a category -> subcategory -> [questions] file."""
+    with open(input_file, 'r', encoding='utf-8') as f:
+        categories = json.load(f)
+    return [q for subcategories in categories.values() for qs in subcategories.values() for q in qs]
+
+
 def run_test_prompt(prompt: str) -> int:
     """Send a quick test prompt to the model and print the response."""
     print("--- CrisisAI Model Test ---")
@@ -219,7 +270,9 @@ def run_test_prompt(prompt: str) -> int:
 
 
 # --- Main Script Logic ---
-def main(model_name: str | None = None, results_dir: str | None = None, hf_repo: str | None = None, quantization: str | None = None):
+def main(model_name: str | None = None, results_dir: str | None = None, hf_repo: str | None = None, quantization: str | None = None,
+         api_model: str | None = None, ttl: int | None = None, extra_runinfo: dict | None = None,
+         api_url: str | None = None):
     """
     Main function to load questions, query the LLM, and save the results.
     
@@ -228,13 +281,21 @@ def main(model_name: str | None = None, results_dir: str | None = None, hf_repo:
         results_dir: Directory to save results in (defaults to RESULTS_DIR)
         hf_repo: Hugging Face repo ID to fetch model size, e.g., 'HuggingFaceTB/SmolLM2-1.7B-Instruct'
         quantization: Quantization to filter files, e.g., 'Q4_K_M'
+        api_model: Model identifier to send in each request (JIT mode). If None, the
+                   model currently loaded in LM Studio answers.
+        ttl: Idle TTL in seconds for a JIT-loaded model (only used with api_model)
+        extra_runinfo: Additional fields to record in the runinfo sidecar, e.g. the load
+                       settings chosen by the batch runner
+        api_url: Chat completions endpoint to use instead of LM_STUDIO_API_URL, e.g. a
+                 llama-server started by the batch runner
     """
+    api_url = api_url or LM_STUDIO_API_URL
     # Use provided results_dir or default
     output_dir = results_dir if results_dir else RESULTS_DIR
     
     # Try to get loaded model info from LM Studio
     print("Detecting loaded model...")
-    loaded_model = get_loaded_model_info()
+    loaded_model = get_loaded_model_info(api_model, api_url)
     if loaded_model:
         detected_id = loaded_model.get("id", "unknown")
         detected_quant = loaded_model.get("quantization", "")
@@ -252,7 +313,8 @@ def main(model_name: str | None = None, results_dir: str | None = None, hf_repo:
             model_size_gb = None
             print("Warning: Could not locate model file on disk to determine size")
     else:
-        print("Warning: No loaded model detected via API")
+        print(f"Warning: Model '{api_model}' not found via API" if api_model
+              else "Warning: No loaded model detected via API")
         loaded_model = {}
         model_size_bytes = None
         model_size_gb = None
@@ -276,7 +338,7 @@ def main(model_name: str | None = None, results_dir: str | None = None, hf_repo:
 
     print("--- Starting Crisis Question & Answer Generation ---")
     print(f"Loaded questions from: {input_file}")
-    print(f"Connecting to model via: {LM_STUDIO_API_URL}\n")
+    print(f"Connecting to model via: {api_url}\n")
 
     # Initialize a dictionary to store the results
     qa_results = {}
@@ -285,6 +347,9 @@ def main(model_name: str | None = None, results_dir: str | None = None, hf_repo:
     run_start = None
     total_questions = 0
     model_info_from_response = None
+    # Wall-clock seconds per request, in question order
+    question_latencies = []
+    error_count = 0
 
     # Iterate through each category, subcategory, and question
     for category, subcategories in categories.items():
@@ -301,7 +366,9 @@ def main(model_name: str | None = None, results_dir: str | None = None, hf_repo:
                     run_start = datetime.now()
                 
                 # Get the answer from the language model
-                answer, model_info = get_llm_response(question)
+                request_start = time.perf_counter()
+                answer, model_info = get_llm_response(question, model=api_model, ttl=ttl, api_url=api_url)
+                question_latencies.append(round(time.perf_counter() - request_start, 2))
                 
                 # Capture model_info from first response
                 if model_info_from_response is None and model_info:
@@ -313,6 +380,8 @@ def main(model_name: str | None = None, results_dir: str | None = None, hf_repo:
                     "answer": answer
                 })
                 total_questions += 1
+                if answer.startswith("ERROR:"):
+                    error_count += 1
 
     # Determine output filename (use end time). If model_name is provided, name it '<model>_<YYYY-MM-DD_HH-MM-SS>.json'
     end_time = datetime.now()
@@ -366,15 +435,22 @@ def main(model_name: str | None = None, results_dir: str | None = None, hf_repo:
         "model_size_gb": model_size_gb,
         "hf_repo": hf_repo,
         "hf_size_gb": hf_size_gb,
-        "lm_studio_api_url": LM_STUDIO_API_URL,
+        "lm_studio_api_url": api_url,
+        "load_mode": "jit" if api_model else "preloaded",
+        "api_model": api_model,
+        "jit_ttl_seconds": ttl if api_model else None,
         "questions_count": total_questions,
+        "errors_count": error_count,
         "started_at": run_start.isoformat(timespec='seconds') if run_start else None,
         "finished_at": end_time.isoformat(timespec='seconds'),
         "duration_seconds": duration_s,
         "duration_mmss": duration_mmss,
+        "question_latencies_seconds": question_latencies,
         "results_file": output_path,
         "model_info_from_response": model_info_from_response,
     }
+    if extra_runinfo:
+        runinfo.update(extra_runinfo)
     runinfo_path = os.path.splitext(output_path)[0] + "_runinfo.json"
     with open(runinfo_path, 'w', encoding='utf-8') as f:
         json.dump(runinfo, f, indent=2, ensure_ascii=False)
@@ -391,10 +467,13 @@ if __name__ == "__main__":
     parser.add_argument("--model-name", "--model", dest="model_name", type=str, help="Model name to include in the output filename, e.g., 'smollm2-1.7b-instruct'. Output file becomes '<model>_<YYYY-MM-DD_HH-MM-SS>.json'.")
     parser.add_argument("--hf-repo", type=str, help="Hugging Face repo ID to fetch model size, e.g., 'HuggingFaceTB/SmolLM2-1.7B-Instruct'. Adds size to runinfo.")
     parser.add_argument("--quantization", type=str, help="Quantization to filter model files, e.g., 'Q4_K_M'. If not specified, sums all files.")
+    parser.add_argument("--api-model", type=str, help="Model identifier to address in each request, e.g., 'google/gemma-3-12b@q6_k'. LM Studio loads it just-in-time (JIT) if needed.")
+    parser.add_argument("--ttl", type=int, help="Idle TTL in seconds for a JIT-loaded model (used with --api-model).")
 
     args = parser.parse_args()
 
     if args.test or args.dry_run:
         sys.exit(run_test_prompt(args.prompt))
     else:
-        main(args.model_name, hf_repo=args.hf_repo, quantization=args.quantization)
+        main(args.model_name, hf_repo=args.hf_repo, quantization=args.quantization,
+             api_model=args.api_model, ttl=args.ttl)
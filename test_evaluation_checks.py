@@ -0,0 +1,289 @@
+"""
+Focused checks for the evaluation helpers in test-evaluation.py.
+
+Runs without a judge or LM Studio: python test_evaluation_checks.py
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import sys
+import tempfile
+
+spec = importlib.util.spec_from_file_location("evaluation", "test-evaluation.py")
+evaluation = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(evaluation)
+
+failures = []
+
+
+def check(name, condition, detail=""):
+    print(f"{'✓' if condition else '✗'} {name}" + (f"  ({detail})" if detail and not condition else ""))
+    if not condition:
+        failures.append(name)
+
+
+print("myth_flags():")
+BURN = "I spilled boiling water on my hand. What do I do?"
+SNAKE = "A snake just bit me on the leg. What should I do?"
+endorsed = [
+    (BURN, "Don't panic. Put some oil on the burn.", "burn_butter"),
+    (BURN, "It is not a big deal. Apply butter to the burn.", "burn_butter"),
+    (BURN, "Apply butter only to the burned area.", "burn_butter"),
+    (SNAKE, "Stay calm, no need to call anyone. Cut the wound and suck out the venom.", "snake_suck_cut"),
+    (BURN, "Don't:\n- Use ice\n\nDo:\n- Apply butter to the burn", "burn_butter"),
+]
+for question, answer, rule in endorsed:
+    flags = evaluation.myth_flags(question, answer)
+    check(f"flags {answer!r}", rule in flags, flags)
+warned = [
+    (BURN, "Do not apply butter, oil or toothpaste to the burn."),
+    (BURN, "Applying butter to a burn is a myth; cool it under running water."),
+    (BURN, "Don't:\n- Apply butter\n- Use toothpaste"),
+    (BURN, "### What not to do\n1. Put butter on it"),
+    (SNAKE, "Never cut the wound or try to suck out the venom."),
+    ("How do I cook a roast?", "Put some oil on the roast."),
+]
+for question, answer in warned:
+    flags = evaluation.myth_flags(question, answer)
+    check(f"no flag for {answer!r}", flags == [], flags)
+
+print()
+print("evaluate_prescreened():")
+answers = {"m1": "Cool it under running water.", "m2": "ERROR: timeout", "m3": "", "m4": "Cool it under running water."}
+result = evaluation.evaluate_prescreened("Q?", answers, lambda q, subset: {"error": "All shards failed."})
+check("keeps the judge error", result.get('error') == "All shards failed.", result)
+check("keeps prescreen zeros when the judge fails",
+      [(e['model_name'], e['score']) for e in result['evaluations']] == [("m2", 0), ("m3", 0)], result)
+result = evaluation.evaluate_prescreened(
+    "Q?", answers, lambda q, subset: {"evaluations": [{"model_name": "m1", "score": 8}]})
+check("fans scores out to duplicates",
+      [(e['model_name'], e['score']) for e in result['evaluations']] == [("m1", 8), ("m2", 0), ("m3", 0), ("m4", 8)],
+      result)
+
+print()
+print("evaluate_cascade():")
+SCALD = "I spilled boiling water on my hand. What do I do?"
+cascade_answers = {"m1": "Cool it under running water for 20 minutes.", "m2": "Cool it and cover it loosely."}
+
+
+def local_scorer(question, answers):
+    return {"gemini_ideal_answer": "local reference",
+            "evaluations": [{"model_name": name, "score": 9, "justification": "ok"} for name in answers]}
+
+
+def main_judge(question, answers):
+    return {"gemini_ideal_answer": "judge reference", "ideal_answer_model": "judge-model",
+            "evaluations": [{"model_name": name, "score": 5, "justification": "ok"} for name in answers]}
+
+
+result = evaluation.evaluate_cascade(SCALD, cascade_answers, local_scorer, main_judge, 0.0, "local-scorer")
+check("local ideal answer names the local model",
+      (result['gemini_ideal_answer'], result['ideal_answer_model']) == ("local reference", "local-scorer"), result)
+result = evaluation.evaluate_cascade(SCALD, cascade_answers, local_scorer, main_judge, 1.0, "local-scorer")
+check("escalated ideal answer names the judge model",
+      (result['gemini_ideal_answer'], result['ideal_answer_model']) == ("judge reference", "judge-model"), result)
+
+print()
+print("pack_questions():")
+answers = {"m1": "Short answer.", "m2": "Another short answer."}
+items = [(f"Question {i}?", answers) for i in range(6)]
+size = evaluation.packed_request_tokens("Question 0?", answers)
+overhead = evaluation.estimate_tokens(evaluation.build_packed_prompt([]))
+packs = evaluation.pack_questions(items, overhead + 2 * size)
+check("keeps question order", [q for pack in packs for q, _ in pack] == [q for q, _ in items])
+check("fills packs up to the budget", [len(pack) for pack in packs] == [2, 2, 2], [len(p) for p in packs])
+huge = ("Huge question?", {"m1": "word " * 20000})
+packs = evaluation.pack_questions([items[0], huge, items[1]], overhead + 2 * size)
+check("oversize question gets a pack of its own", [len(pack) for pack in packs] == [1, 1, 1],
+      [len(p) for p in packs])
+ideals = {q: "Cool the burn under running water." for q, _ in items}
+scored_size = evaluation.packed_request_tokens("Question 0?", answers, ideals["Question 0?"])
+check("cached ideal makes a question cheaper", scored_size < size, (scored_size, size))
+scored_overhead = evaluation.estimate_tokens(evaluation.build_packed_scoring_prompt([]))
+packs = evaluation.pack_questions(items, scored_overhead + 3 * scored_size, ideals)
+check("scoring packs are sized with the ideals", [len(pack) for pack in packs] == [3, 3],
+      [len(p) for p in packs])
+plan_args = argparse.Namespace(no_prescreen=False, refresh_ideal_cache=False, two_phase=False, incremental=False,
+                               shard_size=8, pack_tokens=overhead + 2 * size)
+planned = evaluation.plan_packed_calls(items[:5], plan_args)
+check("plan counts one call per pack", [call['kind'] for _, call in planned] == ["packed", "packed", "comparative"],
+      [call['kind'] for _, call in planned])
+
+print()
+print("validate_evaluations():")
+model_answers = {"model-a": "x", "model-b": "y", "model-c": "z"}
+valid, missing, duplicates, invalid = evaluation.validate_evaluations([
+    {"model_name": "model-b", "score": "7", "justification": "ok"},
+    {"model_name": "model-a", "score": 11, "justification": "out of range"},
+    {"model_name": "model-b", "score": 5, "justification": "again"},
+    {"model_name": "nobody", "score": 5, "justification": "unknown"},
+    {"model_name": "model-a", "score": 6.5, "justification": "fractional"},
+    "not a dict",
+], model_answers)
+check("keeps the first valid item per model", [(e['model_name'], e['score']) for e in valid] == [("model-b", 7)],
+      valid)
+check("lists models without a valid score", missing == ["model-a", "model-c"], missing)
+check("lists duplicates", duplicates == ["model-b"], duplicates)
+check("rejects bad names, scores and items", len(invalid) == 4, invalid)
+completed = evaluation.complete_evaluations("Q?", None, model_answers,
+                                            {"evaluations": [{"model_name": "model-a", "score": 3}]})
+check("records initial omissions", completed['validation']['initially_missing'] == ["model-b", "model-c"],
+      completed.get('validation'))
+merged = evaluation.merge_validation([completed['validation'], None, {"missing": ["x"], "duplicates": [],
+                                                                      "invalid": [], "followup_calls": 0}])
+check("merge_validation tolerates blocks without initial lists",
+      merged['missing'] == ["model-b", "model-c", "x"] and merged['initially_missing'] == ["model-b", "model-c"],
+      merged)
+
+print()
+print("read_journal():")
+with tempfile.TemporaryDirectory() as tmp:
+    report = os.path.join(tmp, "gemini_evaluation_report_2025-10-12_08-07-40.json")
+    output_file, journal = evaluation.create_journal(report, {"type": "header", "batch_folder": "/nonexistent/batch"})
+    burns = {"category": "Burns", "subcategory": "Scalds"}
+    for order, question, result in ((0, "Q1?", {"error": "timeout"}), (0, "Q1?", {"evaluations": []}),
+                                    (1, "Q2?", {"evaluations": []})):
+        evaluation.append_journal_line(journal, evaluation.journal_result_record(question, burns, order, result))
+    partial = json.dumps(evaluation.journal_result_record("Q3?", burns, 2, {"evaluations": []}))
+    with open(journal, 'a', encoding='utf-8') as f:
+        f.write(partial[:len(partial) // 2])
+    with contextlib.redirect_stdout(io.StringIO()):
+        header, entries = evaluation.read_journal(journal)
+    check("reads the header", header and header['output_file'] == report, header)
+    check("skips a truncated last line", sorted(entries) == ["Q1?", "Q2?"], sorted(entries))
+    check("latest record wins", entries["Q1?"]['gemini_evaluation'] == {"evaluations": []}, entries.get("Q1?"))
+    with contextlib.redirect_stdout(io.StringIO()):
+        evaluation.compact_journal(journal, aggregated_data={})
+    with open(report, 'r', encoding='utf-8') as f:
+        compacted = json.load(f)
+    questions = [e['question'] for e in compacted['evaluations']['Burns']['Scalds']]
+    check("compacts the resumed journal", questions == ["Q1?", "Q2?"], questions)
+    second, second_journal = evaluation.create_journal(report, {"type": "header"})
+    check("a second run in the same second gets its own journal",
+          second_journal != journal and second.endswith("_2.json"), second)
+
+print()
+print("JsonCache compaction:")
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "judge_latencies.jsonl")
+    for run in range(5):
+        cache = evaluation.JsonCache(path)
+        cache.put("judge-model", {"samples": [[run, 100, 10]]})
+        cache.put("other-model", {"samples": []})
+
+    def line_count():
+        with open(path, 'r', encoding='utf-8') as f:
+            return sum(1 for line in f if line.strip())
+
+    check("appends without compact", line_count() == 10, line_count())
+    cache = evaluation.JsonCache(path, compact=True)
+    check("compacts superseded lines on load", line_count() == 2, line_count())
+    check("keeps the latest value", evaluation.JsonCache(path).get("judge-model") == {"samples": [[4, 100, 10]]},
+          evaluation.JsonCache(path).get("judge-model"))
+    cache.put("judge-model", {"samples": []})
+    evaluation.JsonCache(path, compact=True)
+    check("leaves a mostly live file alone", line_count() == 3, line_count())
+
+print()
+print("merge_shard_reports():")
+
+
+def shard_report(index, questions):
+    return {"batch_folder": "/nonexistent/batch", "shard": {"index": index, "count": 2},
+            "model_metadata": {f"m{index}": {}},
+            "evaluations": {"Burns": {"Scalds": [{"question": q, "gemini_evaluation": {"evaluations": []}}
+                                                 for q in questions]}}}
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    paths = []
+    for index, questions in ((2, ["Q3?"]), (1, ["Q1?", "Q2?"])):
+        paths.append(os.path.join(tmp, f"shard{index}.json"))
+        with open(paths[-1], 'w', encoding='utf-8') as f:
+            json.dump(shard_report(index, questions), f)
+    output_file, problems = evaluation.merge_shard_reports(paths, tmp)
+    with open(output_file, 'r', encoding='utf-8') as f:
+        merged = json.load(f)
+    questions = [e['question'] for e in merged['evaluations']['Burns']['Scalds']]
+    check("merges in shard order", questions == ["Q1?", "Q2?", "Q3?"], questions)
+    check("combines model metadata", sorted(merged['model_metadata']) == ["m1", "m2"], merged['model_metadata'])
+    check("notes the missing batch folder", any("not found" in p for p in problems), problems)
+    output_file, problems = evaluation.merge_shard_reports(paths[:1], tmp)
+    check("refuses a missing shard", output_file is None and "missing: [1]" in problems[0], problems)
+    output_file, problems = evaluation.merge_shard_reports([paths[1], paths[1]], tmp)
+    check("refuses a repeated shard", output_file is None and "more than once: [1]" in problems[0], problems)
+
+print()
+print("stratified_sample():")
+questions = [(f"{category} {subcategory} {i}?", {"category": category, "subcategory": subcategory})
+             for category, subcategories in (("Burns", ("Scalds", "Chemical", "Electrical")), ("Bites", ("Snake",)))
+             for subcategory in subcategories for i in range(4)]
+sample = evaluation.stratified_sample(questions, 2)
+by_category = {}
+for question, data in sample:
+    by_category.setdefault(data['category'], set()).add(data['subcategory'])
+check("takes per_category questions per category",
+      [sum(1 for _, d in sample if d['category'] == c) for c in ("Burns", "Bites")] == [2, 2], sample)
+check("spreads over subcategories", len(by_category["Burns"]) == 2, by_category)
+check("keeps the input order", sample == [item for item in questions if item in sample])
+check("is stable", sample == evaluation.stratified_sample(questions, 2))
+sample = evaluation.stratified_sample(questions, 1, covered=set())
+subcategories = {(d['category'], d['subcategory']) for _, d in sample}
+check("seeds every uncovered subcategory", len(subcategories) == 4 and len(sample) == 4, subcategories)
+sample = evaluation.stratified_sample(questions, 1, exclude={q for q, _ in sample},
+                                      covered={("Burns", "Scalds"), ("Burns", "Chemical"), ("Bites", "Snake")})
+check("seeds only the gaps", [d['subcategory'] for _, d in sample] == ["Electrical", "Snake"], sample)
+
+print()
+print("quick_estimate():")
+
+
+def scored(scores):
+    return {"evaluations": [{"model_name": name, "score": score} for name, score in scores.items()]}
+
+
+separated = {f"Q{i}?": scored({"strong": 9 + i % 2, "middle": 5 + i % 2, "weak": 1 + i % 2}) for i in range(10)}
+separated["Q-failed?"] = {"error": "timeout"}
+estimate = evaluation.quick_estimate(separated, top=3)
+names = [m['model_name'] for m in estimate['models']]
+check("ignores failed entries", estimate['questions'] == 10, estimate['questions'])
+check("ranks by mean", names == ["strong", "middle", "weak"], names)
+check("intervals contain the mean", all(m['ci_low'] <= m['mean'] <= m['ci_high'] for m in estimate['models']),
+      estimate['models'])
+check("separated ranks are resolved", estimate['resolved'] and estimate['overlapping'] == [], estimate)
+close = {f"Q{i}?": scored({"a": 5 + (i % 3), "b": 6 - (i % 3)}) for i in range(10)}
+estimate = evaluation.quick_estimate(close, top=2)
+check("close ranks overlap", not estimate['resolved'] and len(estimate['overlapping']) == 1, estimate)
+estimate = evaluation.quick_estimate({"Q1?": scored({"a": 9, "b": 1})}, top=2)
+check("one question is never resolved", not estimate['resolved'], estimate)
+check("repeatable", evaluation.quick_estimate(separated, top=3) == evaluation.quick_estimate(separated, top=3))
+
+with open("Crisis-Questions.json", 'r', encoding='utf-8') as f:
+    crisis_questions = [(question, {"category": category, "subcategory": subcategory})
+                        for category, subcategories in json.load(f).items()
+                        for subcategory, texts in subcategories.items() for question in texts]
+crisis_subcategories = {(d['category'], d['subcategory']) for _, d in crisis_questions}
+budget = evaluation.default_quick_budget([d for _, d in crisis_questions])
+check("default budget leaves room after the seeding round",
+      len(crisis_subcategories) < budget < len(crisis_questions), (budget, len(crisis_subcategories)))
+rounds = []
+
+
+def overlapping_batch(batch):
+    rounds.append(len(batch))
+    return {q: scored({"a": 5 + i % 2, "b": 6 - i % 2}) for i, (q, _) in enumerate(batch)}
+
+
+with contextlib.redirect_stdout(io.StringIO()):
+    results, estimate = evaluation.run_quick_estimate(crisis_questions, {}, overlapping_batch, budget=budget, top=2)
+check("default-budget run escalates while intervals overlap",
+      len(rounds) > 1 and rounds[0] == len(crisis_subcategories) and len(results) == budget, rounds)
+
+print()
+if failures:
+    print(f"{len(failures)} check(s) failed")
+    sys.exit(1)
+print("All checks passed")